@@ -1,16 +1,92 @@
+from functools import cached_property
+from itertools import islice
+
 import torch
+from tqdm import tqdm
 from peft import LoraConfig, get_peft_model, AutoPeftModelForCausalLM, PeftModel
 from transformers import (
     AutoTokenizer,
     AutoModelForCausalLM,
     BitsAndBytesConfig,
     DataCollatorForLanguageModeling,
+    DynamicCache,
     TrainingArguments,
 )
 from trl import SFTTrainer
 
 from .likelihoodModel import LikelihoodModel
-from .config import DEFAULT_TRAIN_CONFIG, DEFAULT_BNB_CONFIG, DEFAULT_LORA_CONFIG
+from .config import DEFAULT_TRAIN_CONFIG, DEFAULT_LORA_CONFIG
+
+# compiled batches are padded to sequence lengths rounded up to this multiple,
+# so that few distinct sequence lengths are ever compiled
+_PADDED_SEQ_LEN_MULTIPLE = 64
+
+
+def _round_up(value, multiple):
+    """
+    Rounds `value` up to the nearest multiple of `multiple`.
+    """
+    return -(-value // multiple) * multiple
+
+
+def _padded_seq_len(seq_len, max_length):
+    """
+    Rounds a batch's sequence length up to a multiple of
+    `_PADDED_SEQ_LEN_MULTIPLE`, without exceeding `max_length`.
+    """
+    return min(_round_up(seq_len, _PADDED_SEQ_LEN_MULTIPLE), max_length)
+
+
+def _crop_cache(cache, max_length):
+    """
+    Crops the key/value `cache` down to its first `max_length` tokens.
+    """
+    num_extra = cache.get_seq_length() - max_length
+    if num_extra > 0:
+        cache.crop(-num_extra)
+
+
+def _length_buckets(lengths, batch_size, max_batch_tokens):
+    """
+    Greedily packs consecutive inputs into batches such that each batch has
+    at most `batch_size` inputs and, once padded to its longest input, at
+    most `max_batch_tokens` tokens. An input longer than `max_batch_tokens`
+    gets a batch of its own.
+
+    :param lengths: Input lengths, sorted in ascending order
+    :param batch_size: Max number of inputs per batch
+    :param max_batch_tokens: Max number of padded tokens per batch
+
+    :return: List of (start, end) index ranges of the batches
+    """
+    buckets = []
+    start = 0
+    for end in range(1, len(lengths) + 1):
+        size = end - start
+        if size > batch_size or lengths[end - 1] * size > max_batch_tokens:
+            if size > 1:
+                buckets.append((start, end - 1))
+                start = end - 1
+    buckets.append((start, len(lengths)))
+    return buckets
+
+
+def _future_log_likelihood(logits, labels):
+    """
+    Sums the log probabilities of the `labels` under `logits` with
+    `cross_entropy`, so that only the logits predicting the future span are
+    normalized rather than a softmax over every position. Labels set to -100
+    are ignored.
+
+    :param logits: Logits predicting each label, of shape (..., num_labels, vocab_size)
+    :param labels: Future token ids, of shape (..., num_labels)
+
+    :return: Log likelihoods, of shape (...)
+    """
+    nll = torch.nn.functional.cross_entropy(
+        logits.reshape(-1, logits.shape[-1]).float(), labels.reshape(-1), reduction="none"
+    )
+    return -nll.view(labels.shape).sum(dim=-1)
 
 
 class GemmaLikelihoodModel(LikelihoodModel):
@@ -21,8 +97,26 @@ class GemmaLikelihoodModel(LikelihoodModel):
     :param model_id: Gemma model id version
     :param device: Device to use
     :param train_config: Training config for fine-tuning
-    :param bnb_config: bitsandbytes config for quantization
+    :param bnb_config: bitsandbytes config to load the model quantized with,
+        e.g. `DEFAULT_BNB_CONFIG`; if None, the model is loaded in bfloat16
     :param lora_config: LoRA config for fine-tuning
+    :param batch_size: Max number of utterances to score per forward pass
+    :param max_batch_tokens: Max number of (padded) tokens to score per forward
+        pass; utterances are sorted by length so that batches need little padding
+    :param prefix_caching: Whether to score each conversation's utterances in
+        order, reusing the key/value cache of the token prefix shared with the
+        previous utterance's context. Useful when contexts grow incrementally
+        (e.g. the full conversation history), in which case `batch_size` is unused
+    :param token_cache_size: Number of tokenized texts to keep in the token
+        cache, oldest evicted first. Future contexts are tokenized once for
+        both the actual and reference likelihoods if they all fit
+    :param compile_model: Whether to run batched inference through
+        `torch.compile`. Defaults to compiling only on CUDA devices without
+        `bnb_config`. The model is compiled on first use in `transform`, which
+        takes a while and only pays off over many batches; pass False when
+        scoring a handful of utterances. Batches are left-padded to sequence
+        lengths rounded up to a multiple of 64 to avoid recompiling, while the
+        number of rows per batch is left dynamic
     """
 
     def __init__(
@@ -31,26 +125,66 @@ class GemmaLikelihoodModel(LikelihoodModel):
         model_id="google/gemma-2b",
         device="cuda" if torch.cuda.is_available() else "cpu",
         train_config=DEFAULT_TRAIN_CONFIG,
-        bnb_config=DEFAULT_BNB_CONFIG,
+        bnb_config=None,
         lora_config=DEFAULT_LORA_CONFIG,
+        batch_size=64,
+        max_batch_tokens=4096,
+        prefix_caching=False,
+        token_cache_size=65536,
+        compile_model=None,
     ):
-        self.tokenizer = AutoTokenizer.from_pretrained(
-            model_id, token=hf_token, padding_side="right"
-        )
+        if bnb_config is not None:
+            model_kwargs = {"quantization_config": bnb_config}
+        else:
+            model_kwargs = {"torch_dtype": torch.bfloat16}
         self.model = AutoModelForCausalLM.from_pretrained(
-            model_id, quantization_config=bnb_config, device_map="auto", token=hf_token
+            model_id,
+            attn_implementation="sdpa",
+            device_map="auto",
+            token=hf_token,
+            **model_kwargs,
         )
-        self.data_collator = DataCollatorForLanguageModeling(tokenizer=self.tokenizer, mlm=False)
+        self.model.eval()
+        self.model_id = model_id
         self.hf_token = hf_token
         self.device = device
         self.train_config = train_config
         self.lora_config = lora_config
         self.bnb_config = bnb_config
         self.max_length = self.train_config["max_seq_length"]
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.prefix_caching = prefix_caching
+        if compile_model is None:
+            compile_model = torch.device(device).type == "cuda" and bnb_config is None
+        self.compile_model = compile_model
+        self._compiled_model = None
+        self.token_cache_size = token_cache_size
+        self._token_cache = {}
 
     def name(self):
         return self.__class__.name
 
+    @cached_property
+    def tokenizer(self):
+        """
+        Tokenizer of the model, loaded on first access.
+        """
+        tokenizer = AutoTokenizer.from_pretrained(
+            self.model_id, token=self.hf_token, padding_side="right"
+        )
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        return tokenizer
+
+    @cached_property
+    def data_collator(self):
+        """
+        Data collator for language modeling, only needed for fine-tuning and
+        built on first access.
+        """
+        return DataCollatorForLanguageModeling(tokenizer=self.tokenizer, mlm=False)
+
     def fit(self, train_data, val_data):
         """
         Fine-tunes the Gemma model on the provided `train_data` and validates
@@ -86,69 +220,259 @@ class GemmaLikelihoodModel(LikelihoodModel):
         )
         trainer.train()
 
+    def _inference_model(self):
+        """
+        Returns the model to run batched inference with, compiling it with
+        `torch.compile` on first use if `compile_model` is set. Compilation is
+        deferred so that `fit` trains the uncompiled model.
+
+        :return: Model to run forward passes with
+        """
+        if not self.compile_model:
+            return self.model
+        if self._compiled_model is None:
+            self._compiled_model = torch.compile(
+                self.model, mode="reduce-overhead", fullgraph=False
+            )
+        return self._compiled_model
+
+    def _tokenize_texts(self, texts, max_length):
+        """
+        Tokenizes `texts` into tuples of token ids, truncated to `max_length`.
+        Texts are looked up in the token cache first, since the same future
+        contexts are scored against both actual and reference contexts, and
+        the remaining texts are tokenized with one batched tokenizer call.
+
+        :param texts: List of texts to tokenize
+        :param max_length: Max number of tokens to keep
+
+        :return: List of tuples of token ids
+        """
+        cache = self._token_cache
+        missing = list(dict.fromkeys(text for text in texts if (text, max_length) not in cache))
+        if missing:
+            token_ids = self.tokenizer(missing, truncation=True, max_length=max_length)["input_ids"]
+            for text, ids in zip(missing, token_ids):
+                cache[(text, max_length)] = tuple(ids)
+        result = [cache[(text, max_length)] for text in texts]
+        # evict the oldest entries only once every text has been looked up
+        num_extra = len(cache) - self.token_cache_size
+        if num_extra > 0:
+            for key in list(islice(cache, num_extra)):
+                del cache[key]
+        return result
+
+    def _tokenize(self, text, max_length):
+        """
+        Tokenizes `text` into a tuple of token ids, truncated to `max_length`,
+        through the token cache.
+
+        :param text: Text to tokenize
+        :param max_length: Max number of tokens to keep
+
+        :return: Tuple of token ids
+        """
+        return self._tokenize_texts([text], max_length)[0]
+
     def _calculate_likelihood_prob(self, past_context, future_context):
         """
-        Computes the utterance likelihoods given the previous context to
-        condition on and the future context to predict.
+        Computes the utterance likelihood given the previous context to
+        condition on and the future context to predict, as a batch of one.
 
         :param past_context: Context to condition
         :param future_context: Context to predict likelihood
 
-        :return: Likelihoods of contexts
+        :return: Likelihood of the future context
         """
-        past_context = "\n\n".join(past_context)
-        future_context = "\n\n".join(future_context)
+        rows, future_lens = self._tokenize_pairs([past_context], [future_context])
+        return self._calculate_likelihood_probs(rows, future_lens).item()
 
-        context_ids = self.tokenizer.encode(
-            past_context,
-            truncation=True,
-            max_length=self.max_length,
-            return_tensors="pt",
+    def _calculate_convo_likelihood_probs(self, convo_prev_contexts, convo_future_contexts):
+        """
+        Computes the utterance likelihoods of a single conversation in order,
+        reusing the key/value cache of the longest token prefix shared with
+        the previous utterance's context instead of recomputing it. Only the
+        context tokens are kept in the cache; the future tokens are cropped
+        off after each utterance.
+
+        :param convo_prev_contexts: Dictionary of utterance id to context to condition
+        :param convo_future_contexts: Dictionary of utterance id to context to predict
+
+        :return: Dictionary of utterance id to likelihood
+        """
+        convo_likelihoods = {}
+        cache = DynamicCache()
+        cached_ids = ()
+        for utt_id, past_context in convo_prev_contexts.items():
+            if utt_id not in convo_future_contexts:
+                continue
+            context_ids = self._tokenize("\n\n".join(past_context), self.max_length)
+            future_ids = self._tokenize(
+                "\n\n".join(convo_future_contexts[utt_id]), self.max_length - 1
+            )
+            input_ids = (context_ids + future_ids)[-self.max_length :]
+            num_context = len(input_ids) - len(future_ids)
+            # at least one context token is fed so its logits predict the first future token
+            num_shared = 0
+            max_shared = min(len(cached_ids), num_context - 1)
+            while num_shared < max_shared and cached_ids[num_shared] == input_ids[num_shared]:
+                num_shared += 1
+            _crop_cache(cache, num_shared)
+
+            new_ids = torch.tensor([input_ids[num_shared:]], dtype=torch.long, device=self.device)
+            target = torch.tensor(future_ids, dtype=torch.long, device=self.device)
+            with torch.inference_mode():
+                logits = self.model(new_ids, past_key_values=cache, use_cache=True).logits
+                convo_likelihoods[utt_id] = _future_log_likelihood(
+                    logits[0, -len(future_ids) - 1 : -1], target
+                ).item()
+            _crop_cache(cache, num_context)
+            cached_ids = input_ids[:num_context]
+        return convo_likelihoods
+
+    def _tokenize_pairs(self, past_contexts, future_contexts):
+        """
+        Tokenizes pairs of previous and future contexts through the token
+        cache, joining each pair into a single input truncated to `max_length`.
+
+        :param past_contexts: List of contexts to condition
+        :param future_contexts: List of contexts to predict likelihood
+
+        :return: Tuple of the list of input token ids and the list of future lengths
+        """
+        context_ids = self._tokenize_texts(
+            ["\n\n".join(context) for context in past_contexts], self.max_length
         )
-        future_ids = self.tokenizer.encode(
-            future_context,
-            truncation=True,
-            max_length=self.max_length,
-            return_tensors="pt",
+        future_ids = self._tokenize_texts(
+            ["\n\n".join(context) for context in future_contexts], self.max_length - 1
         )
-        input_ids = torch.cat([context_ids, future_ids], dim=1)
-        if input_ids.shape[1] > self.max_length:
-            input_ids = input_ids[:, -self.max_length :]
-        input_ids = input_ids.to(self.device)
-        with torch.no_grad():
-            probs = torch.nn.functional.softmax(self.model(input_ids)[0], dim=-1)
-        cond_log_probs = []
-        for i, future_id in enumerate(future_ids[0]):
-            index = i + (input_ids.shape[1] - future_ids.shape[1]) - 1
-            logprob = torch.log(probs[0, index, future_id])
-            cond_log_probs.append(logprob.item())
-        result = sum(cond_log_probs)
-        return result
+        rows = [
+            (past + future)[-self.max_length :] for past, future in zip(context_ids, future_ids)
+        ]
+        future_lens = [len(future) for future in future_ids]
+        return rows, future_lens
+
+    def _calculate_likelihood_probs(self, rows, future_lens):
+        """
+        Computes the utterance likelihoods for a batch of tokenized inputs,
+        each a previous context followed by the future context to predict,
+        using a single forward pass over the left-padded batch. The batch is
+        packed in pinned memory and copied to the device asynchronously, and
+        the likelihoods are left on the device so that consecutive batches
+        are not serialized by a device sync.
+
+        :param rows: List of input token ids
+        :param future_lens: Number of future context tokens at the end of each row
+
+        :return: Tensor of likelihoods on `device`
+        """
+        seq_len = max(len(row) for row in rows)
+        max_future_len = max(future_lens)
+        pin_memory = torch.device(self.device).type == "cuda"
+        if self.compile_model:
+            seq_len = _padded_seq_len(seq_len, self.max_length)
+        input_ids = torch.full(
+            (len(rows), seq_len),
+            self.tokenizer.pad_token_id,
+            dtype=torch.long,
+            pin_memory=pin_memory,
+        )
+        attention_mask = torch.zeros((len(rows), seq_len), dtype=torch.long, pin_memory=pin_memory)
+        labels = torch.full(
+            (len(rows), max_future_len), -100, dtype=torch.long, pin_memory=pin_memory
+        )
+        for i, (row, future_len) in enumerate(zip(rows, future_lens)):
+            row = torch.tensor(row, dtype=torch.long)
+            input_ids[i, seq_len - len(row) :] = row
+            attention_mask[i, seq_len - len(row) :] = 1
+            labels[i, max_future_len - future_len :] = row[len(row) - future_len :]
+
+        input_ids = input_ids.to(self.device, non_blocking=True)
+        attention_mask = attention_mask.to(self.device, non_blocking=True)
+        labels = labels.to(self.device, non_blocking=True)
+        with torch.inference_mode():
+            return self._score(input_ids, attention_mask, labels)
+
+    def _score(self, input_ids, attention_mask, labels):
+        """
+        Runs the forward pass over a left-padded batch and sums the log
+        probabilities of the future tokens in each row.
+
+        :param input_ids: Left-padded input token ids
+        :param attention_mask: Attention mask of the inputs
+        :param labels: Right-aligned future token ids, -100 where ignored
+
+        :return: Tensor of likelihoods
+        """
+        position_ids = (attention_mask.cumsum(dim=-1) - 1).clamp(min=0)
+        if self.compile_model:
+            # the number of rows varies between batches, so compile it as a dynamic dimension
+            for tensor in (input_ids, attention_mask, position_ids):
+                torch._dynamo.maybe_mark_dynamic(tensor, 0)
+        logits = self._inference_model()(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            use_cache=False,
+        ).logits
+        # rows are left-padded, so every future span ends at the last position
+        return _future_log_likelihood(logits[:, -labels.shape[1] - 1 : -1], labels)
 
     def transform(self, test_data, verbosity=5):
         """
         Computes the utterance likelihoods for the provided `test_data`.
+        All contexts are tokenized up front, sorted by length and scored in
+        batches of up to `batch_size` utterances and `max_batch_tokens` padded
+        tokens, possibly spanning several conversations, or one conversation
+        at a time with a reused key/value cache if `prefix_caching` is set.
 
         :param test_data: Data to compute likelihoods over
-        :param verbosity: Verbosity to print updated messages
+        :param verbosity: Minimum number of iterations between progress bar updates
 
         :return: Likelihoods of the `test_data`
         """
         prev_contexts, future_contexts = test_data
+        self.model.eval()
+        if self.prefix_caching:
+            return [
+                self._calculate_convo_likelihood_probs(convo_prev_contexts, convo_future_contexts)
+                for convo_prev_contexts, convo_future_contexts in tqdm(
+                    zip(prev_contexts, future_contexts),
+                    total=len(prev_contexts),
+                    miniters=verbosity,
+                )
+            ]
+
         likelihoods = []
-        for i in range(len(prev_contexts)):
-            if i % verbosity == 0 and i > 0:
-                print(i, "/", len(test_data))
+        keys, past_contexts, utt_future_contexts = [], [], []
+        for convo_prev_contexts, convo_future_contexts in zip(prev_contexts, future_contexts):
             convo_likelihoods = {}
-            convo_prev_contexts = prev_contexts[i]
-            convo_future_contexts = future_contexts[i]
+            likelihoods.append(convo_likelihoods)
             for utt_id in convo_prev_contexts:
                 if utt_id not in convo_future_contexts:
                     continue
-                utt_prev_context = convo_prev_contexts[utt_id]
-                utt_future_context = convo_future_contexts[utt_id]
-                convo_likelihoods[utt_id] = self._calculate_likelihood_prob(
-                    past_context=utt_prev_context, future_context=utt_future_context
+                keys.append((convo_likelihoods, utt_id))
+                past_contexts.append(convo_prev_contexts[utt_id])
+                utt_future_contexts.append(convo_future_contexts[utt_id])
+        if not keys:
+            return likelihoods
+
+        rows, future_lens = self._tokenize_pairs(past_contexts, utt_future_contexts)
+        order = sorted(range(len(rows)), key=lambda i: len(rows[i]))
+        probs = []
+        lengths = [len(rows[i]) for i in order]
+        if self.compile_model:
+            # bucket on the padded lengths, so that padded batches fit the token budget
+            lengths = [_padded_seq_len(length, self.max_length) for length in lengths]
+        buckets = _length_buckets(lengths, self.batch_size, self.max_batch_tokens)
+        for start, end in tqdm(buckets, miniters=verbosity):
+            bucket = order[start:end]
+            probs.append(
+                self._calculate_likelihood_probs(
+                    [rows[i] for i in bucket], [future_lens[i] for i in bucket]
                 )
-            likelihoods.append(convo_likelihoods)
+            )
+        for i, prob in zip(order, torch.cat(probs).tolist()):
+            convo_likelihoods, utt_id = keys[i]
+            convo_likelihoods[utt_id] = prob
         return likelihoods
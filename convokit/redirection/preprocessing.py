@@ -25,7 +25,7 @@ def format_conversations(convos):
     formatted_convos = []
     for convo in convos:
         utts = [utt for utt in convo.iter_utterances()]
-        roles = list({utt.meta["role"] for utt in utts})
+        roles = list(dict.fromkeys(utt.meta["role"] for utt in utts))
         spk_prefixes = default_speaker_prefixes(roles)
         role_to_prefix = {roles[i]: spk_prefixes[i] for i in range(len(roles))}
         formatted_utts = []
@@ -7,6 +7,28 @@ from .preprocessing import format_conversations, get_chunk_dataset
 import numpy as np
 
 
+def _log1mexp(x):
+    """
+    Computes log(1 - exp(x)) elementwise for log probabilities `x`, switching
+    between `expm1` and `log1p` to stay accurate both near 0 and for very
+    negative values.
+    """
+    return np.where(x > -np.log(2), np.log(-np.expm1(x)), np.log1p(-np.exp(x)))
+
+
+def _redirection_scores(actual_probs, reference_probs):
+    """
+    Computes redirection scores from arrays of actual and reference log
+    likelihoods, as the difference of their log odds.
+
+    :param actual_probs: Array of actual log likelihoods
+    :param reference_probs: Array of reference log likelihoods
+
+    :return: Array of redirection scores
+    """
+    return actual_probs - _log1mexp(actual_probs) - reference_probs + _log1mexp(reference_probs)
+
+
 class Redirection(Transformer):
     """
     ConvoKit transformer to compute redirection scores, derived from
@@ -98,17 +120,17 @@ class Redirection(Transformer):
                 print(i, "/", len(test_convos))
             convo_actual_likelihoods = actual_likelihoods[i]
             convo_reference_likelihoods = reference_likelihoods[i]
-            for utt in convo.iter_utterances():
-                if utt.id in convo_actual_likelihoods and utt.id in convo_reference_likelihoods:
-                    actual_prob = convo_actual_likelihoods[utt.id]
-                    reference_prob = convo_reference_likelihoods[utt.id]
-                    redirection = (
-                        actual_prob
-                        - np.log(1 - np.exp(actual_prob))
-                        - reference_prob
-                        + np.log(1 - np.exp(reference_prob))
-                    )
-                    utt.meta[self.redirection_attribute_name] = redirection
+            utts = [
+                utt
+                for utt in convo.iter_utterances()
+                if utt.id in convo_actual_likelihoods and utt.id in convo_reference_likelihoods
+            ]
+            redirections = _redirection_scores(
+                np.array([convo_actual_likelihoods[utt.id] for utt in utts]),
+                np.array([convo_reference_likelihoods[utt.id] for utt in utts]),
+            )
+            for utt, redirection in zip(utts, redirections):
+                utt.meta[self.redirection_attribute_name] = redirection
 
         return corpus
 
@@ -0,0 +1,60 @@
+import unittest
+
+from convokit.util import UtteranceListView
+
+
+class TestUtteranceListView(unittest.TestCase):
+    def setUp(self):
+        self.utts = ("u0", "u1", "u2", "u3", "u4")
+        self.view = UtteranceListView(self.utts, 1, 4)
+
+    def test_len_and_iter(self):
+        self.assertEqual(len(self.view), 3)
+        self.assertEqual(list(self.view), ["u1", "u2", "u3"])
+        self.assertEqual(len(UtteranceListView(self.utts, 2, 2)), 0)
+        self.assertEqual(list(UtteranceListView(self.utts)), list(self.utts))
+
+    def test_indexing(self):
+        self.assertEqual(self.view[0], "u1")
+        self.assertEqual(self.view[2], "u3")
+        self.assertRaises(IndexError, lambda: self.view[3])
+
+    def test_negative_indexing(self):
+        self.assertEqual(self.view[-1], "u3")
+        self.assertEqual(self.view[-3], "u1")
+        self.assertRaises(IndexError, lambda: self.view[-4])
+
+    def test_slicing(self):
+        self.assertIsInstance(self.view[1:], UtteranceListView)
+        self.assertEqual(list(self.view[1:]), ["u2", "u3"])
+        self.assertEqual(list(self.view[:-1]), ["u1", "u2"])
+        self.assertEqual(list(self.view[::-1]), ["u3", "u2", "u1"])
+        self.assertEqual(list(self.view[::2]), ["u1", "u3"])
+        self.assertEqual(list(self.view[5:]), [])
+        self.assertEqual(self.view[1:][-1], "u3")
+
+    def test_equality(self):
+        self.assertEqual(self.view, ["u1", "u2", "u3"])
+        self.assertEqual(["u1", "u2", "u3"], self.view)
+        self.assertEqual(self.view, ("u1", "u2", "u3"))
+        self.assertEqual(self.view, UtteranceListView(list(self.utts), 1, 4))
+        self.assertNotEqual(self.view, ["u1", "u2"])
+        self.assertNotEqual(self.view, ["u1", "u2", "u4"])
+        self.assertNotEqual(self.view, "u1u2u3")
+
+    def test_concatenation(self):
+        self.assertEqual(self.view + ["u9"], ["u1", "u2", "u3", "u9"])
+        self.assertEqual(["u9"] + self.view, ["u9", "u1", "u2", "u3"])
+        self.assertEqual(self.view + self.view[:1], ["u1", "u2", "u3", "u1"])
+        self.assertIsInstance(self.view + ["u9"], list)
+        self.assertRaises(TypeError, lambda: self.view + "u9")
+
+    def test_sequence_methods(self):
+        self.assertIn("u2", self.view)
+        self.assertNotIn("u0", self.view)
+        self.assertEqual(self.view.index("u3"), 2)
+        self.assertEqual(list(reversed(self.view)), ["u3", "u2", "u1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
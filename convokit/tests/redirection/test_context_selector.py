@@ -0,0 +1,98 @@
+import unittest
+
+from convokit.model import Corpus, Speaker, Utterance
+
+try:
+    from convokit.redirection.contextSelector import (
+        default_previous_context_selector,
+        default_future_context_selector,
+    )
+except ImportError:
+    raise unittest.SkipTest("Redirection module requires ML dependencies")
+
+
+def construct_conversation(roles):
+    speakers = {role: Speaker(id=f"speaker_{role}") for role in set(roles)}
+    utterances = [
+        Utterance(
+            id=f"u{i}",
+            conversation_id="convo",
+            reply_to=None if i == 0 else f"u{i - 1}",
+            speaker=speakers[role],
+            text=f"text {i}",
+            timestamp=i,
+            meta={"role": role},
+        )
+        for i, role in enumerate(roles)
+    ]
+    return Corpus(utterances=utterances).get_conversation("convo")
+
+
+class TestDefaultContextSelectors(unittest.TestCase):
+    def setUp(self):
+        # "user" is a substring of "superuser", so roles must be matched exactly
+        self.convo = construct_conversation(["superuser", "user", "superuser", "superuser", "user"])
+
+    def test_previous_contexts(self):
+        actual_contexts, reference_contexts = default_previous_context_selector(self.convo)
+        self.assertEqual(
+            actual_contexts,
+            {
+                "u2": ("Speaker B: text 1", "Speaker A: text 2"),
+                "u3": ("Speaker B: text 1", "Speaker A: text 3"),
+                "u4": ("Speaker A: text 3", "Speaker B: text 4"),
+            },
+        )
+        self.assertEqual(
+            reference_contexts,
+            {
+                "u2": ("Speaker B: text 1", "Speaker A: text 0"),
+                "u3": ("Speaker B: text 1", "Speaker A: text 0"),
+                "u4": ("Speaker A: text 3", "Speaker B: text 1"),
+            },
+        )
+
+    def test_future_contexts(self):
+        future_contexts = default_future_context_selector(self.convo)
+        self.assertEqual(
+            future_contexts,
+            {
+                "u0": ("Speaker B: text 1",),
+                "u1": ("Speaker A: text 2",),
+                "u2": ("Speaker B: text 4",),
+                "u3": ("Speaker B: text 4",),
+            },
+        )
+
+    def test_roles_ordered_by_first_appearance(self):
+        convo = construct_conversation(["user", "superuser", "user"])
+        actual_contexts, reference_contexts = default_previous_context_selector(convo)
+        self.assertEqual(actual_contexts, {"u2": ("Speaker B: text 1", "Speaker A: text 2")})
+        self.assertEqual(reference_contexts, {"u2": ("Speaker B: text 1", "Speaker A: text 0")})
+        self.assertEqual(
+            default_future_context_selector(convo),
+            {"u0": ("Speaker B: text 1",), "u1": ("Speaker A: text 2",)},
+        )
+
+
+class TestNonDyadicConversations(unittest.TestCase):
+    def assert_no_contexts(self, convo):
+        self.assertEqual(default_previous_context_selector(convo), ({}, {}))
+        self.assertEqual(default_future_context_selector(convo), {})
+
+    def test_third_role_appearing_late(self):
+        self.assert_no_contexts(construct_conversation(["a", "b", "a", "b", "a", "c"]))
+
+    def test_single_role(self):
+        self.assert_no_contexts(construct_conversation(["a", "a", "a"]))
+
+    def test_dyadic(self):
+        convo = construct_conversation(["a", "b", "a", "b"])
+        actual_contexts, reference_contexts = default_previous_context_selector(convo)
+        self.assertEqual(list(actual_contexts), ["u2", "u3"])
+        self.assertEqual(list(reference_contexts), ["u2", "u3"])
+        self.assertEqual(set(default_future_context_selector(convo)), {"u0", "u1", "u2"})
+
+
+if __name__ == "__main__":
+    unittest.main()
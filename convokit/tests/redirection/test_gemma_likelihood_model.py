@@ -0,0 +1,120 @@
+import shutil
+import tempfile
+import unittest
+
+try:
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors
+    from transformers import GemmaConfig, GemmaForCausalLM, PreTrainedTokenizerFast
+
+    from convokit.redirection.gemmaLikelihoodModel import GemmaLikelihoodModel
+except ImportError:
+    raise unittest.SkipTest("Redirection module requires ML dependencies")
+
+WORDS = "hello world how are you fine thanks what is this the a an of to".split()
+
+
+def save_tiny_gemma(path):
+    vocab = {"<pad>": 0, "<eos>": 1, "<bos>": 2, "<unk>": 3}
+    for word in WORDS:
+        vocab[word] = len(vocab)
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="<bos> $A", special_tokens=[("<bos>", 2)]
+    )
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        pad_token="<pad>",
+        eos_token="<eos>",
+        bos_token="<bos>",
+        unk_token="<unk>",
+    ).save_pretrained(path)
+
+    torch.manual_seed(0)
+    config = GemmaConfig(
+        vocab_size=len(vocab),
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=1,
+        head_dim=8,
+        pad_token_id=0,
+    )
+    GemmaForCausalLM(config).save_pretrained(path)
+
+
+def conversation_contexts():
+    turns = [
+        "hello world",
+        "how are you",
+        "fine thanks what is this",
+        "the a an of to the a an of to hello",
+        "what is this",
+    ]
+    # contexts grow with the conversation, so consecutive contexts share prefixes,
+    # and the last ones are truncated to the max length
+    prev_contexts = {f"u{i}": turns[: i + 1] * 2 for i in range(len(turns))}
+    future_contexts = {f"u{i}": [turns[(i + 1) % len(turns)]] for i in range(len(turns) - 1)}
+    return [prev_contexts, {"v0": ["hello"], "v1": ["hello", "you"]}], [
+        future_contexts,
+        {"v0": ["world"], "v1": ["fine thanks"]},
+    ]
+
+
+class TestGemmaLikelihoodModel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model_dir = tempfile.mkdtemp()
+        save_tiny_gemma(cls.model_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.model_dir)
+
+    def make_model(self, **kwargs):
+        model = GemmaLikelihoodModel(
+            hf_token=None,
+            model_id=self.model_dir,
+            device="cpu",
+            train_config={"max_seq_length": 32},
+            compile_model=False,
+            **kwargs,
+        )
+        # compare in float32 so that differences are not bfloat16 rounding
+        model.model = model.model.float()
+        return model
+
+    def test_prefix_caching_matches_batched(self):
+        test_data = conversation_contexts()
+        batched = self.make_model(batch_size=3).transform(test_data)
+        cached = self.make_model(prefix_caching=True).transform(test_data)
+        self.assertEqual(len(batched), len(cached))
+        for batched_convo, cached_convo in zip(batched, cached):
+            self.assertEqual(batched_convo.keys(), cached_convo.keys())
+            for utt_id in batched_convo:
+                self.assertAlmostEqual(batched_convo[utt_id], cached_convo[utt_id], places=4)
+
+    def test_single_pair_matches_batched(self):
+        prev_contexts, future_contexts = conversation_contexts()
+        model = self.make_model()
+        batched = model.transform((prev_contexts, future_contexts))
+        for utt_id, likelihood in batched[0].items():
+            single = model._calculate_likelihood_prob(
+                prev_contexts[0][utt_id], future_contexts[0][utt_id]
+            )
+            self.assertAlmostEqual(single, likelihood, places=4)
+
+    def test_token_cache_is_bounded(self):
+        model = self.make_model(token_cache_size=3)
+        texts = ["hello", "world", "hello world", "how are you"]
+        token_ids = model._tokenize_texts(texts, 32)
+        self.assertEqual(len(token_ids), len(texts))
+        self.assertEqual(token_ids[2], token_ids[0] + token_ids[1][1:])
+        self.assertEqual(len(model._token_cache), 3)
+        self.assertEqual(model._tokenize("how are you", 32), token_ids[3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+try:
+    from convokit.redirection.gemmaLikelihoodModel import _length_buckets
+except ImportError:
+    raise unittest.SkipTest("Redirection module requires ML dependencies")
+
+
+class TestLengthBuckets(unittest.TestCase):
+    def test_batch_size_cap(self):
+        buckets = _length_buckets([1] * 10, batch_size=4, max_batch_tokens=1000)
+        self.assertEqual(buckets, [(0, 4), (4, 8), (8, 10)])
+
+    def test_token_budget_cap(self):
+        # each batch is padded to its last (longest) input
+        buckets = _length_buckets([2, 3, 4, 5, 10, 10], batch_size=100, max_batch_tokens=20)
+        self.assertEqual(buckets, [(0, 4), (4, 6)])
+        lengths = [2, 3, 4, 5, 10, 10]
+        for start, end in buckets:
+            self.assertLessEqual(lengths[end - 1] * (end - start), 20)
+
+    def test_oversized_single_row(self):
+        buckets = _length_buckets([5, 50, 60], batch_size=8, max_batch_tokens=20)
+        self.assertEqual(buckets, [(0, 1), (1, 2), (2, 3)])
+
+    def test_covers_all_inputs(self):
+        lengths = sorted([7, 3, 12, 1, 9, 9, 4, 30, 2, 15])
+        buckets = _length_buckets(lengths, batch_size=3, max_batch_tokens=25)
+        self.assertEqual(buckets[0][0], 0)
+        self.assertEqual(buckets[-1][1], len(lengths))
+        for (_, end), (start, _) in zip(buckets, buckets[1:]):
+            self.assertEqual(end, start)
+        for start, end in buckets:
+            self.assertGreater(end, start)
+            self.assertLessEqual(end - start, 3)
+
+    def test_single_input(self):
+        self.assertEqual(_length_buckets([3], batch_size=1, max_batch_tokens=1), [(0, 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
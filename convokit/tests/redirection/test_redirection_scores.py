@@ -0,0 +1,47 @@
+import math
+import unittest
+
+import numpy as np
+
+try:
+    from convokit.redirection.redirection import _log1mexp, _redirection_scores
+except ImportError:
+    raise unittest.SkipTest("Redirection module requires ML dependencies")
+
+
+class TestLog1mexp(unittest.TestCase):
+    def test_near_zero(self):
+        x = np.array([-1e-12, -1e-8, -1e-4])
+        expected = [math.log(-math.expm1(v)) for v in x]
+        np.testing.assert_allclose(_log1mexp(x), expected, rtol=1e-12)
+        # the naive formula loses most significant digits this close to 0
+        self.assertGreater(abs(math.log(1 - math.exp(-1e-12)) - expected[0]), 1e-6)
+
+    def test_very_negative(self):
+        x = np.array([-40.0, -100.0, -700.0])
+        expected = [-math.exp(v) for v in x]
+        np.testing.assert_allclose(_log1mexp(x), expected, rtol=1e-12)
+        self.assertTrue(np.all(_log1mexp(x) < 0))
+
+    def test_moderate(self):
+        x = np.array([-0.1, -np.log(2), -1.0, -5.0])
+        np.testing.assert_allclose(_log1mexp(x), np.log(1 - np.exp(x)), rtol=1e-12)
+
+
+class TestRedirectionScores(unittest.TestCase):
+    def test_log_odds_difference(self):
+        actual = np.array([-0.5, -2.0, -10.0])
+        reference = np.array([-1.0, -2.0, -3.0])
+
+        def log_odds(p):
+            return np.log(np.exp(p) / (1 - np.exp(p)))
+
+        np.testing.assert_allclose(
+            _redirection_scores(actual, reference),
+            log_odds(actual) - log_odds(reference),
+            rtol=1e-10,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
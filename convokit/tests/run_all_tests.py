@@ -30,9 +30,11 @@ def setup_test_environment():
         "general.merge_corpus",
         "general.metadata_operations",
         "general.traverse_convo",
+        "general.utterance_list_view",
         "bag_of_words",
         "phrasing_motifs",
         "politeness_strategies",
+        "redirection",
         "text_processing",
     ]
 
@@ -5,6 +5,7 @@ import urllib.request
 import uuid
 import warnings
 import zipfile
+from collections.abc import Sequence
 from typing import Dict
 from .convokitConfig import ConvoKitConfig
 import requests
@@ -416,3 +417,65 @@ def deprecation(prev_name: str, new_name: str, stacklevel: int = 3):
 
 def create_safe_id():
     return "_" + uuid.uuid4().hex
+
+
+class UtteranceListView(Sequence):
+    """
+    Read-only view over the utterances of a list or tuple, so that contexts
+    of the same conversation can share its chronological utterances instead
+    of each holding a copied slice. Slicing a view returns another view, and
+    views compare equal to and concatenate with lists and tuples holding the
+    same utterances.
+
+    :param utts: List or tuple of utterances to view
+    :param start: Index of the first utterance in the view
+    :param stop: Index one past the last utterance in the view; defaults to the end of `utts`
+    """
+
+    __slots__ = ("_utts", "_indices")
+
+    def __init__(self, utts, start=0, stop=None):
+        self._utts = utts
+        self._indices = range(len(utts))[start:stop]
+
+    @classmethod
+    def _from_indices(cls, utts, indices):
+        view = cls.__new__(cls)
+        view._utts = utts
+        view._indices = indices
+        return view
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return UtteranceListView._from_indices(self._utts, self._indices[index])
+        try:
+            return self._utts[self._indices[index]]
+        except IndexError:
+            raise IndexError("UtteranceListView index out of range") from None
+
+    def __iter__(self):
+        utts = self._utts
+        return (utts[i] for i in self._indices)
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, UtteranceListView)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __add__(self, other):
+        if not isinstance(other, (list, tuple, UtteranceListView)):
+            return NotImplemented
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        if not isinstance(other, (list, tuple)):
+            return NotImplemented
+        return list(other) + list(self)
+
+    def __repr__(self):
+        return f"UtteranceListView({list(self)!r})"
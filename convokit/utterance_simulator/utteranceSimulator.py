@@ -2,6 +2,7 @@ from typing import Callable, Optional, Union, Any, List, Iterator
 from collections import namedtuple
 
 from convokit import Transformer, Corpus
+from convokit.util import UtteranceListView
 from .utteranceSimulatorModel import UtteranceSimulatorModel
 from .util import ContextTuple
 
@@ -61,18 +62,12 @@ class UtteranceSimulator(Transformer):
 
         :return: fitted UtteranceSimulator Transformer
         """
-        contexts = self._create_context_iterator(
-            corpus=corpus,
-            context_selector=context_selector,
-            include_future_context=True,
-        )
+        # traverse the corpus once for both training and validation contexts
+        all_contexts = list(self._iter_contexts(corpus=corpus, include_future_context=True))
+        contexts = self._select_contexts(all_contexts, context_selector)
         val_contexts = None
         if val_context_selector is not None:
-            val_contexts = self._create_context_iterator(
-                corpus=corpus,
-                context_selector=val_context_selector,
-                include_future_context=True,
-            )
+            val_contexts = self._select_contexts(all_contexts, val_context_selector)
         self.simulator_model.fit(contexts, val_contexts)
         return self
 
@@ -98,17 +93,50 @@ class UtteranceSimulator(Transformer):
             simulated_reply_attribute_name=self.simulated_reply_attribute_name,
         )
 
+        simulated_replies = simulations_df[self.simulated_reply_attribute_name].to_dict()
         for utt in corpus.iter_utterances():
-            if utt.id in simulations_df.index:
-                utt.add_meta(
-                    self.simulated_reply_attribute_name,
-                    simulations_df.loc[utt.id][self.simulated_reply_attribute_name],
-                )
-            else:
-                utt.add_meta(self.simulated_reply_attribute_name, None)
+            utt.add_meta(self.simulated_reply_attribute_name, simulated_replies.get(utt.id))
 
         return corpus
 
+    def _iter_contexts(self, corpus: Corpus, include_future_context: bool = False):
+        """
+        Helper function that generates the conversational contexts across the
+        entire corpus. Contexts and future contexts are read-only views over
+        each conversation's chronological utterance list rather than copies,
+        so that contexts can be selected without copying them.
+        """
+        for convo in corpus.iter_conversations():
+            chronological_utts = convo.get_chronological_utterance_list()
+            num_utts = len(chronological_utts)
+            for i in range(num_utts):
+                current_utt = chronological_utts[i]
+                context = UtteranceListView(chronological_utts, 0, i + 1)
+                if include_future_context:
+                    future_context = UtteranceListView(chronological_utts, i + 1, num_utts)
+                else:
+                    future_context = None
+                yield ContextTuple(context, current_utt, future_context, convo.id)
+
+    def _select_contexts(
+        self,
+        contexts: Iterator[ContextTuple],
+        context_selector: Callable[[ContextTuple], bool],
+    ):
+        """
+        Helper function that generates the contexts that satisfy the provided
+        context selector, with their contexts and future contexts copied into
+        lists.
+        """
+        for context_tuple in contexts:
+            if len(context_tuple.context) == 0 or not context_selector(context_tuple):
+                continue
+            future_context = context_tuple.future_context
+            yield context_tuple._replace(
+                context=list(context_tuple.context),
+                future_context=None if future_context is None else list(future_context),
+            )
+
     def _create_context_iterator(
         self,
         corpus: Corpus,
@@ -119,19 +147,7 @@ class UtteranceSimulator(Transformer):
         Helper function that generates an iterator over conversational contexts
         that satisfy the provided context selector, across the entire corpus
         """
-        for convo in corpus.iter_conversations():
-            chronological_utts = convo.get_chronological_utterance_list()
-            for i in range(len(chronological_utts)):
-                current_utt = chronological_utts[i]
-                context = chronological_utts[: (i + 1)]
-                if include_future_context:
-                    if i == len(chronological_utts) - 1:
-                        future_context = []
-                    else:
-                        future_context = chronological_utts[(i + 1) :]
-                else:
-                    future_context = None
-                context_tuple = ContextTuple(context, current_utt, future_context, convo.id)
-                if len(context_tuple.context) == 0 or not context_selector(context_tuple):
-                    continue
-                yield context_tuple
+        return self._select_contexts(
+            self._iter_contexts(corpus=corpus, include_future_context=include_future_context),
+            context_selector,
+        )